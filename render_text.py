@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+VRChat World Instance Monitor - テキスト変換
+
+vrchat_instance_monitor.py が出力したNDJSONファイルを読み込み、
+人が読みやすいテキスト形式に変換します。
+"""
+
+import sys
+import argparse
+from typing import Dict, Iterator, TextIO
+
+import orjson
+
+
+def read_records(path: str) -> Iterator[Dict]:
+    """
+    NDJSONファイルから収集データを1件ずつ読み込む
+    
+    Args:
+        path: NDJSONファイルのパス
+    
+    Yields:
+        収集データの辞書
+    
+    JSONとして解釈できない行（旧バージョンのテキスト形式など）は
+    行番号を標準エラー出力に表示して読み飛ばす。
+    """
+    with open(path, 'rb') as f:
+        for lineno, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                data = orjson.loads(line)
+            except orjson.JSONDecodeError as e:
+                print(f"警告: {path}:{lineno} はNDJSON形式ではないため読み飛ばします（{e}）", file=sys.stderr)
+                continue
+            if not isinstance(data, dict):
+                print(f"警告: {path}:{lineno} は収集データではないため読み飛ばします", file=sys.stderr)
+                continue
+            yield data
+
+
+def render_record(data: Dict) -> str:
+    """
+    収集データ1件をテキスト形式に変換する
+    
+    Args:
+        data: 収集データ
+    
+    Returns:
+        テキスト形式の文字列
+    """
+    buf = []
+    
+    # ヘッダー行
+    buf.append(f"\n{'='*80}\n")
+    buf.append(f"収集日時: {data['timestamp']}\n")
+    buf.append(f"ワールド名: {data['world_name']}\n")
+    buf.append(f"ワールドID: {data['world_id']}\n")
+    buf.append(f"総ユーザー数: {data['total_occupants']}\n")
+    buf.append(f"パブリックユーザー数: {data['public_occupants']}\n")
+    buf.append(f"プライベートユーザー数: {data['private_occupants']}\n")
+    buf.append(f"アクティブインスタンス数: {data['active_instances']}\n")
+    buf.append(f"{'-'*80}\n")
+    
+    # インスタンス詳細
+    columns = data['instances']
+    instance_ids = columns['instance_id']
+    if instance_ids:
+        user_counts = columns['user_count']
+        # 詳細情報の列はCOLLECT_DETAILS=trueで収集した場合のみ存在する
+        types = columns.get('type')
+        capacities = columns.get('capacity')
+        fulls = columns.get('full')
+        platforms = columns.get('platforms')
+        
+        for i in range(len(instance_ids)):
+            buf.append(f"\nインスタンス #{i + 1}\n")
+            buf.append(f"  ID: {instance_ids[i]}\n")
+            buf.append(f"  ユーザー数: {user_counts[i]}\n")
+            
+            if types and types[i] is not None:
+                buf.append(f"  タイプ: {types[i]}\n")
+            if capacities and capacities[i] is not None:
+                buf.append(f"  最大収容人数: {capacities[i]}\n")
+            if fulls and fulls[i] is not None:
+                buf.append(f"  満員: {'はい' if fulls[i] else 'いいえ'}\n")
+            if platforms and platforms[i]:
+                buf.append(f"  プラットフォーム別: {platforms[i]}\n")
+    else:
+        buf.append(f"\n※ アクティブなインスタンスが見つかりませんでした\n")
+    
+    buf.append(f"\n{'='*80}\n")
+    
+    return "".join(buf)
+
+
+def render(path: str, out: TextIO):
+    """
+    NDJSONファイルの全レコードをテキスト形式で書き出す
+    
+    Args:
+        path: NDJSONファイルのパス
+        out: 出力先
+    """
+    for data in read_records(path):
+        out.write(render_record(data))
+
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(description="NDJSON形式の監視データをテキスト形式に変換します")
+    parser.add_argument('input', nargs='?', default='vrchat_instances.ndjson', help="入力ファイル（デフォルト: vrchat_instances.ndjson）")
+    parser.add_argument('-o', '--output', help="出力ファイル（省略時は標準出力）")
+    args = parser.parse_args()
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            render(args.input, f)
+    else:
+        render(args.input, sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
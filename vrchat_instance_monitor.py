@@ -3,17 +3,20 @@
 VRChat World Instance Monitor
 
 このスクリプトは特定のVRChatワールドのアクティブインスタンス数と
-各インスタンスのユーザー数を10分ごとに取得してテキストファイルに記録します。
+各インスタンスのユーザー数を10分ごとに取得してNDJSONファイルに記録します。
 """
 
 import os
 import sys
-import time
-import json
+import orjson
 import base64
-import requests
-from datetime import datetime
-from typing import Dict, List, Optional
+import asyncio
+import contextlib
+import httpx
+from aiolimiter import AsyncLimiter
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional, Tuple
 import logging
 from pathlib import Path
 
@@ -42,13 +45,28 @@ logging.basicConfig(
     ]
 )
 logger = logging.getLogger(__name__)
+# httpxはリクエストごとにINFOログを出力するため抑制する
+logging.getLogger('httpx').setLevel(logging.WARNING)
 
 
 class VRChatAPI:
     """VRChat APIクライアント"""
     
     BASE_URL = "https://api.vrchat.cloud/api/1"
+    AUTH_URL = f"{BASE_URL}/auth/user"
     COOKIE_FILE = "vrchat_auth_cookie.txt"
+    # レート制限（トークンバケット）: 最大バースト数と1秒あたりの補充数
+    RATE_LIMIT_BURST = 10
+    RATE_LIMIT_PER_SECOND = 2
+    # 接続を維持するためのキープアライブ送信間隔（秒）
+    KEEPALIVE_INTERVAL = 120
+    # 一時的なエラーの再試行: 対象ステータス、最大回数、指数バックオフの係数、待機時間の上限（秒）
+    RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+    MAX_RETRIES = 5
+    RETRY_BACKOFF_FACTOR = 0.5
+    RETRY_MAX_DELAY = 60
+    # 接続失敗時の再試行回数
+    CONNECT_RETRIES = 3
     
     def __init__(self, username: Optional[str] = None, password: Optional[str] = None):
         """
@@ -60,10 +78,30 @@ class VRChatAPI:
         """
         self.username = username or os.getenv('VRCHAT_USERNAME')
         self.password = password or os.getenv('VRCHAT_PASSWORD')
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        })
+        self.session = httpx.AsyncClient(
+            headers={
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+            },
+            timeout=30.0,
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                # アイドル接続はキープアライブ送信間隔より長く保持する
+                limits=httpx.Limits(
+                    max_connections=100,
+                    max_keepalive_connections=20,
+                    keepalive_expiry=self.KEEPALIVE_INTERVAL * 1.5
+                ),
+                retries=self.CONNECT_RETRIES
+            )
+        )
+        
+        self._limiter = AsyncLimiter(self.RATE_LIMIT_BURST, self.RATE_LIMIT_BURST / self.RATE_LIMIT_PER_SECOND)
+        # 再認証は同時に1つだけ実行し、認証に成功するたびに世代番号を進める
+        self._auth_lock = asyncio.Lock()
+        self._auth_generation = 0
+        # 条件付きリクエスト用: ワールドIDごとの(検証ヘッダー, その検証ヘッダーに対応するワールド情報)
+        # 304の場合に返すワールド情報はここにのみ保持する
+        self._world_validators: Dict[str, Tuple[Dict[str, str], Dict]] = {}
         
         # 保存されたcookieを読み込む
         self._load_cookie()
@@ -72,35 +110,115 @@ class VRChatAPI:
         """保存されたauth cookieを読み込む"""
         if os.path.exists(self.COOKIE_FILE):
             try:
-                with open(self.COOKIE_FILE, 'r') as f:
-                    cookie_data = json.load(f)
-                    for cookie in cookie_data:
-                        self.session.cookies.set(
-                            cookie['name'],
-                            cookie['value'],
-                            domain=cookie.get('domain', '.vrchat.cloud')
-                        )
+                with open(self.COOKIE_FILE, 'rb') as f:
+                    cookie_data = orjson.loads(f.read())
+                for cookie in cookie_data:
+                    self.session.cookies.set(
+                        cookie['name'],
+                        cookie['value'],
+                        domain=cookie.get('domain', '.vrchat.cloud')
+                    )
                 logger.info("保存されたcookieを読み込みました")
             except Exception as e:
-                logger.warning(f"Cookie読み込みエラー: {e}")
+                logger.warning("Cookie読み込みエラー: %s", e)
     
     def _save_cookie(self):
         """auth cookieを保存する"""
         try:
             cookie_data = []
-            for cookie in self.session.cookies:
+            for cookie in self.session.cookies.jar:
                 cookie_data.append({
                     'name': cookie.name,
                     'value': cookie.value,
                     'domain': cookie.domain
                 })
-            with open(self.COOKIE_FILE, 'w') as f:
-                json.dump(cookie_data, f)
+            with open(self.COOKIE_FILE, 'wb') as f:
+                f.write(orjson.dumps(cookie_data))
             logger.info("Cookieを保存しました")
         except Exception as e:
-            logger.error(f"Cookie保存エラー: {e}")
+            logger.error("Cookie保存エラー: %s", e)
+    
+    def _retry_delay(self, response: httpx.Response, attempt: int) -> float:
+        """
+        再試行までの待機時間を求める
+        
+        Retry-Afterヘッダーがあればその値を優先し、なければ指数バックオフを使う。
+        
+        Args:
+            response: 再試行対象のレスポンス
+            attempt: これまでの再試行回数
+            
+        Returns:
+            待機時間（秒）
+        """
+        retry_after = response.headers.get('Retry-After')
+        if retry_after:
+            try:
+                return max(0.0, float(retry_after))
+            except ValueError:
+                pass
+            try:
+                retry_at = parsedate_to_datetime(retry_after)
+                return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+            except (TypeError, ValueError):
+                pass
+        
+        return self.RETRY_BACKOFF_FACTOR * (2 ** attempt)
     
-    def authenticate(self) -> bool:
+    async def _get(self, url: str, **kwargs) -> httpx.Response:
+        """
+        レート制限の範囲内でGETリクエストを送信する
+        
+        429や5xxなどの一時的なエラーの場合は、待機してから最大MAX_RETRIES回まで再試行する。
+        
+        Args:
+            url: リクエストURL
+            **kwargs: httpx.AsyncClient.getに渡す引数
+            
+        Returns:
+            レスポンス（再試行しても失敗した場合は最後のレスポンス）
+        """
+        for attempt in range(self.MAX_RETRIES + 1):
+            async with self._limiter:
+                response = await self.session.get(url, **kwargs)
+            
+            if response.status_code not in self.RETRY_STATUS_CODES or attempt == self.MAX_RETRIES:
+                return response
+            
+            delay = self._retry_delay(response, attempt)
+            if delay > self.RETRY_MAX_DELAY:
+                logger.warning("再試行までの待機時間が長すぎるため再試行しません: status=%s, delay=%.1f秒", response.status_code, delay)
+                return response
+            
+            logger.warning("一時的なエラーのため%.1f秒後に再試行します: status=%s (%s/%s)", delay, response.status_code, attempt + 1, self.MAX_RETRIES)
+            await asyncio.sleep(delay)
+        
+        return response
+    
+    async def keepalive(self):
+        """
+        収集の合間も接続を維持するため、定期的に軽量なリクエストを送信する
+        
+        次回収集の最初のリクエストでTCP/TLSハンドシェイクが発生しないようにする。
+        キャンセルされるまで実行し続ける。
+        """
+        while True:
+            await asyncio.sleep(self.KEEPALIVE_INTERVAL)
+            try:
+                async with self._limiter:
+                    response = await self.session.head(f"{self.BASE_URL}/auth")
+                logger.debug("キープアライブ: status=%s", response.status_code)
+            except httpx.HTTPError as e:
+                logger.debug("キープアライブ失敗: %s", e)
+            except Exception as e:
+                # 予期しないエラーでもタスクを終了させず、次回の送信を続ける
+                logger.warning("キープアライブで予期しないエラー: %s", e, exc_info=True)
+    
+    async def close(self):
+        """HTTPクライアントを閉じる"""
+        await self.session.aclose()
+    
+    async def authenticate(self) -> bool:
         """
         VRChat APIに認証する
         
@@ -121,24 +239,42 @@ class VRChatAPI:
                 'Authorization': f'Basic {auth_token}'
             }
             
-            response = self.session.get(
-                f"{self.BASE_URL}/auth/user",
-                headers=headers
-            )
+            response = await self._get(self.AUTH_URL, headers=headers)
             
             if response.status_code == 200:
                 logger.info("認証に成功しました")
+                self._auth_generation += 1
                 self._save_cookie()
                 return True
             else:
-                logger.error(f"認証失敗: {response.status_code} - {response.text}")
+                logger.error("認証失敗: %s - %s", response.status_code, response.text)
                 return False
         
         except Exception as e:
-            logger.error(f"認証エラー: {e}")
+            logger.error("認証エラー: %s", e)
             return False
     
-    def get_world_instances(self, world_id: str) -> Optional[List]:
+    async def _reauthenticate(self, generation: int) -> bool:
+        """
+        401を受け取ったリクエストのために再認証する
+        
+        並行するリクエストが同時に401を受け取っても、ログインは1回だけ行う。
+        待機中に他のリクエストが再認証を済ませていれば、その結果を再利用する。
+        
+        Args:
+            generation: リクエスト送信時点の認証世代番号
+            
+        Returns:
+            再認証済み（または他のリクエストが再認証済み）の場合True
+        """
+        async with self._auth_lock:
+            if generation != self._auth_generation:
+                logger.debug("他のリクエストで再認証済みのため、その認証を再利用します")
+                return True
+            logger.warning("認証が必要です。再認証を試みます...")
+            return await self.authenticate()
+    
+    async def get_world_instances(self, world_id: str) -> Optional[List]:
         """
         ワールドのインスタンス情報を取得する（新しいエンドポイント）
         
@@ -149,32 +285,37 @@ class VRChatAPI:
             インスタンス情報のリスト、失敗時はNone
         """
         try:
-            response = self.session.get(f"{self.BASE_URL}/worlds/{world_id}/instances")
-            
-            logger.debug(f"インスタンス情報取得レスポンス: status={response.status_code}")
-            
-            if response.status_code == 200:
-                data = response.json()
-                logger.debug(f"インスタンス情報取得成功: count={len(data) if isinstance(data, list) else 'N/A'}")
-                return data
-            elif response.status_code == 401:
-                logger.warning("認証が必要です。再認証を試みます...")
-                if self.authenticate():
-                    return self.get_world_instances(world_id)
-                return None
-            else:
-                logger.error(f"インスタンス情報取得失敗: {response.status_code}")
-                logger.error(f"レスポンス内容: {response.text[:500]}")
-                return None
+            url = f"{self.BASE_URL}/worlds/{world_id}/instances"
+            for attempt in range(2):
+                generation = self._auth_generation
+                response = await self._get(url)
+                
+                logger.debug("インスタンス情報取得レスポンス: status=%s", response.status_code)
+                
+                if response.status_code == 200:
+                    data = orjson.loads(response.content)
+                    logger.debug("インスタンス情報取得成功: count=%s", len(data) if isinstance(data, list) else 'N/A')
+                    return data
+                elif response.status_code == 401 and attempt == 0:
+                    if not await self._reauthenticate(generation):
+                        return None
+                    continue
+                else:
+                    logger.error("インスタンス情報取得失敗: %s", response.status_code)
+                    logger.error("レスポンス内容: %.500s", response.text)
+                    return None
         
         except Exception as e:
-            logger.error(f"インスタンス情報取得エラー: {e}", exc_info=True)
+            logger.error("インスタンス情報取得エラー: %s", e, exc_info=True)
             return None
     
-    def get_world_info(self, world_id: str) -> Optional[Dict]:
+    async def get_world_info(self, world_id: str) -> Optional[Dict]:
         """
         ワールド情報を取得する
         
+        前回のレスポンスにETag/Last-Modifiedがあれば条件付きリクエストを送信し、
+        304 Not Modifiedの場合は前回のワールド情報を返す。
+        
         Args:
             world_id: ワールドID
             
@@ -185,50 +326,70 @@ class VRChatAPI:
             # includeInstances=trueパラメータを追加してインスタンス情報を取得
             url = f"{self.BASE_URL}/worlds/{world_id}"
             params = {'includeInstances': 'true'}
-            logger.info(f"リクエストURL: {url}?includeInstances=true")
+            logger.info("リクエストURL: %s?includeInstances=true", url)
             
-            response = self.session.get(url, params=params)
+            validators = self._world_validators.get(world_id)
+            headers = validators[0] if validators else None
             
-            logger.info(f"ワールド情報取得レスポンス: status={response.status_code}")
-            logger.debug(f"実際のURL: {response.url}")
-            
-            if response.status_code == 200:
-                data = response.json()
-                instances_raw = data.get('instances', [])
-                logger.info(f"ワールド情報取得成功: name={data.get('name')}, occupants={data.get('occupants')}, instances_count={len(instances_raw)}")
-                logger.debug(f"instancesフィールドの型: {type(instances_raw)}")
-                if len(instances_raw) > 0:
-                    logger.debug(f"最初のインスタンス: {instances_raw[0]}")
+            for attempt in range(2):
+                generation = self._auth_generation
+                response = await self._get(url, params=params, headers=headers)
                 
-                # インスタンス情報の詳細ログ
-                instances = data.get('instances', [])
-                if instances:
-                    logger.info(f"取得したインスタンス数: {len(instances)}")
-                    logger.info(f"インスタンスデータのサンプル: {instances[:3] if len(instances) > 3 else instances}")
-                else:
-                    logger.warning("インスタンスリストが空です")
-                    logger.warning(f"instancesフィールドの値: {instances}")
-                    logger.warning(f"occupants: {data.get('occupants')}, publicOccupants: {data.get('publicOccupants')}")
-                    # レスポンス全体をデバッグ出力
-                    logger.debug(f"レスポンス全体（最初の1000文字）: {str(data)[:1000]}")
+                logger.info("ワールド情報取得レスポンス: status=%s", response.status_code)
+                logger.debug("実際のURL: %s", response.url)
                 
-                return data
-            elif response.status_code == 401:
-                logger.warning("認証が必要です。再認証を試みます...")
-                if self.authenticate():
-                    return self.get_world_info(world_id)
-                return None
-            else:
-                logger.error(f"ワールド情報取得失敗: {response.status_code}")
-                logger.error(f"リクエストURL: {response.url}")
-                logger.error(f"レスポンス内容: {response.text[:500]}")
-                return None
+                if response.status_code == 200:
+                    data = orjson.loads(response.content)
+                    instances_raw = data.get('instances', [])
+                    logger.info("ワールド情報取得成功: name=%s, occupants=%s, instances_count=%s", data.get('name'), data.get('occupants'), len(instances_raw))
+                    logger.debug("instancesフィールドの型: %s", type(instances_raw))
+                    if len(instances_raw) > 0:
+                        logger.debug("最初のインスタンス: %s", instances_raw[0])
+                
+                    # インスタンス情報の詳細ログ
+                    instances = data.get('instances', [])
+                    if instances:
+                        logger.info("取得したインスタンス数: %s", len(instances))
+                        logger.info("インスタンスデータのサンプル: %s", instances[:3])
+                    else:
+                        logger.warning("インスタンスリストが空です")
+                        logger.warning("instancesフィールドの値: %s", instances)
+                        logger.warning("occupants: %s, publicOccupants: %s", data.get('occupants'), data.get('publicOccupants'))
+                        # レスポンス全体をデバッグ出力
+                        logger.debug("レスポンス全体（最初の1000文字）: %.1000s", data)
+                
+                    conditional_headers = {}
+                    etag = response.headers.get('ETag')
+                    if etag:
+                        conditional_headers['If-None-Match'] = etag
+                    last_modified = response.headers.get('Last-Modified')
+                    if last_modified:
+                        conditional_headers['If-Modified-Since'] = last_modified
+                    if conditional_headers:
+                        self._world_validators[world_id] = (conditional_headers, data)
+                    else:
+                        # 検証ヘッダーがなくなった場合は古い値を送り続けないよう破棄する
+                        self._world_validators.pop(world_id, None)
+                    
+                    return data
+                elif response.status_code == 304 and validators:
+                    logger.info("ワールド情報は前回から更新されていません（304 Not Modified）")
+                    return validators[1]
+                elif response.status_code == 401 and attempt == 0:
+                    if not await self._reauthenticate(generation):
+                        return None
+                    continue
+                else:
+                    logger.error("ワールド情報取得失敗: %s", response.status_code)
+                    logger.error("リクエストURL: %s", response.url)
+                    logger.error("レスポンス内容: %.500s", response.text)
+                    return None
         
         except Exception as e:
-            logger.error(f"ワールド情報取得エラー: {e}", exc_info=True)
+            logger.error("ワールド情報取得エラー: %s", e, exc_info=True)
             return None
     
-    def get_instance_info(self, world_id: str, instance_id: str) -> Optional[Dict]:
+    async def get_instance_info(self, world_id: str, instance_id: str) -> Optional[Dict]:
         """
         インスタンス詳細情報を取得する
         
@@ -240,64 +401,87 @@ class VRChatAPI:
             インスタンス情報の辞書、失敗時はNone
         """
         try:
-            response = self.session.get(
-                f"{self.BASE_URL}/worlds/{world_id}/{instance_id}"
-            )
-            
-            logger.debug(f"インスタンス情報取得: instance={instance_id}, status={response.status_code}")
-            
-            if response.status_code == 200:
-                data = response.json()
-                logger.debug(f"インスタンス詳細: n_users={data.get('n_users')}, type={data.get('type')}, full={data.get('full')}")
-                return data
-            elif response.status_code == 401:
-                logger.warning("認証が必要です。再認証を試みます...")
-                if self.authenticate():
-                    return self.get_instance_info(world_id, instance_id)
-                return None
-            else:
-                logger.warning(f"インスタンス情報取得失敗: {response.status_code} (Instance: {instance_id})")
-                logger.debug(f"レスポンス内容: {response.text[:200]}")
-                return None
+            url = f"{self.BASE_URL}/worlds/{world_id}/{instance_id}"
+            for attempt in range(2):
+                generation = self._auth_generation
+                response = await self._get(url)
+                
+                logger.debug("インスタンス情報取得: instance=%s, status=%s", instance_id, response.status_code)
+                
+                if response.status_code == 200:
+                    data = orjson.loads(response.content)
+                    logger.debug("インスタンス詳細: n_users=%s, type=%s, full=%s", data.get('n_users'), data.get('type'), data.get('full'))
+                    return data
+                elif response.status_code == 401 and attempt == 0:
+                    if not await self._reauthenticate(generation):
+                        return None
+                    continue
+                else:
+                    logger.warning("インスタンス情報取得失敗: %s (Instance: %s)", response.status_code, instance_id)
+                    logger.debug("レスポンス内容: %.200s", response.text)
+                    return None
         
         except Exception as e:
-            logger.error(f"インスタンス情報取得エラー: {e}")
+            logger.error("インスタンス情報取得エラー: %s", e)
             return None
 
 
 class InstanceMonitor:
     """インスタンス監視クラス"""
     
-    def __init__(self, world_id: str, output_file: str = "vrchat_instances.txt"):
+    # インスタンス詳細取得の同時実行数
+    MAX_CONCURRENT_REQUESTS = 8
+    
+    def __init__(self, world_id: str, output_file: str = "vrchat_instances.ndjson", collect_details: bool = False):
         """
         初期化
         
         Args:
             world_id: 監視するワールドID
             output_file: 出力ファイル名
+            collect_details: インスタンスごとに詳細情報（タイプ、収容人数など）を取得するかどうか
         """
         self.world_id = world_id
         self.output_file = output_file
+        self.collect_details = collect_details
         self.api = VRChatAPI()
+        self._semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_REQUESTS)
+        # 出力ファイルのディスクリプタ（監視中は開いたままにする）
+        self._out_fd: Optional[int] = None
+        # 実行中のファイル書き込み（次回の保存時または終了時に完了を待つ）
+        self._pending_save: Optional[asyncio.Task] = None
+    
+    async def _fetch_instance_detail(self, instance_id: str) -> Optional[Dict]:
+        """
+        同時実行数の範囲内でインスタンス詳細を取得する
+        
+        Args:
+            instance_id: インスタンスID
+            
+        Returns:
+            インスタンス情報の辞書、失敗時はNone
+        """
+        async with self._semaphore:
+            return await self.api.get_instance_info(self.world_id, instance_id)
     
-    def collect_data(self) -> Optional[Dict]:
+    async def collect_data(self) -> Optional[Dict]:
         """
         現在のインスタンスデータを収集する
         
         Returns:
             収集したデータの辞書、失敗時はNone
         """
-        logger.info(f"ワールド {self.world_id} のデータを収集中...")
+        logger.info("ワールド %s のデータを収集中...", self.world_id)
         
         # ワールド情報を取得
-        world_info = self.api.get_world_info(self.world_id)
+        world_info = await self.api.get_world_info(self.world_id)
         if not world_info:
             logger.error("ワールド情報の取得に失敗しました")
             return None
         
         # レスポンスの検証
         if not isinstance(world_info, dict):
-            logger.error(f"ワールド情報が辞書型ではありません: type={type(world_info)}")
+            logger.error("ワールド情報が辞書型ではありません: type=%s", type(world_info))
             return None
         
         # get_world_infoにより includeInstances=true でインスタンス情報を取得
@@ -305,12 +489,12 @@ class InstanceMonitor:
         
         # インスタンスデータの検証
         if not isinstance(instances_data, list):
-            logger.error(f"インスタンスデータがリスト型ではありません: type={type(instances_data)}")
-            logger.error(f"instances_data値: {instances_data}")
+            logger.error("インスタンスデータがリスト型ではありません: type=%s", type(instances_data))
+            logger.error("instances_data値: %s", instances_data)
             instances_data = []
         
-        logger.info(f"ワールド情報: name={world_info.get('name')}, occupants={world_info.get('occupants')}")
-        logger.info(f"取得したインスタンス数: {len(instances_data)}")
+        logger.info("ワールド情報: name=%s, occupants=%s", world_info.get('name'), world_info.get('occupants'))
+        logger.info("取得したインスタンス数: %s", len(instances_data))
         
         # データ構造
         data = {
@@ -321,114 +505,218 @@ class InstanceMonitor:
             'public_occupants': world_info.get('publicOccupants', 0),
             'private_occupants': world_info.get('privateOccupants', 0),
             'active_instances': len(instances_data),
-            'instances': []
+            # インスタンス情報は列ごとのリストで保持する（i番目の要素がi番目のインスタンス）
+            # 詳細情報の列はインスタンス詳細を取得する場合のみ追加する
+            'instances': {
+                'instance_id': [],
+                'user_count': []
+            }
         }
         
         # インスタンスが0の場合の警告
         if len(instances_data) == 0:
             logger.warning("アクティブなインスタンスが見つかりませんでした")
-            logger.warning(f"ワールド情報の全フィールド: {list(world_info.keys())}")
-            logger.warning(f"occupants={world_info.get('occupants')}, publicOccupants={world_info.get('publicOccupants')}")
+            logger.warning("ワールド情報の全フィールド: %s", list(world_info.keys()))
+            logger.warning("occupants=%s, publicOccupants=%s", world_info.get('occupants'), world_info.get('publicOccupants'))
+        
+        # ループ内で繰り返し参照する属性はローカル変数に束縛しておく
+        debug = logger.debug
+        info = logger.info
+        warning = logger.warning
         
-        # 各インスタンスの詳細情報を取得
+        # 各インスタンスの検証
+        instances = []
+        append_instance = instances.append
         for idx, instance in enumerate(instances_data):
-            logger.debug(f"処理中のインスタンス #{idx + 1}: {instance}")
+            debug("処理中のインスタンス #%s: %s", idx + 1, instance)
             
             # インスタンスデータの検証
             if not instance:
-                logger.warning(f"インスタンス #{idx + 1} が空です")
+                warning("インスタンス #%s が空です", idx + 1)
                 continue
             
             if not isinstance(instance, (list, tuple)):
-                logger.warning(f"インスタンス #{idx + 1} がリストまたはタプルではありません: type={type(instance)}, value={instance}")
+                warning("インスタンス #%s がリストまたはタプルではありません: type=%s, value=%s", idx + 1, type(instance), instance)
                 continue
             
             if len(instance) < 2:
-                logger.warning(f"インスタンス #{idx + 1} の要素数が不足しています: len={len(instance)}, value={instance}")
+                warning("インスタンス #%s の要素数が不足しています: len=%s, value=%s", idx + 1, len(instance), instance)
                 continue
             
             instance_id = instance[0]
             user_count = instance[1]
             
-            logger.info(f"インスタンス #{idx + 1}: ID={instance_id}, ユーザー数={user_count}")
-            
-            # インスタンス詳細を取得（オプション）
-            instance_detail = self.api.get_instance_info(self.world_id, instance_id)
-            
-            instance_data = {
-                'instance_id': instance_id,
-                'user_count': user_count
-            }
-            
-            if instance_detail:
-                instance_data.update({
-                    'n_users': instance_detail.get('n_users', 0),
-                    'capacity': instance_detail.get('capacity', 0),
-                    'type': instance_detail.get('type', 'unknown'),
-                    'full': instance_detail.get('full', False),
-                    'platforms': instance_detail.get('platforms', {})
-                })
-            else:
-                logger.warning(f"インスタンス #{idx + 1} の詳細情報を取得できませんでした")
+            info("インスタンス #%s: ID=%s, ユーザー数=%s", idx + 1, instance_id, user_count)
+            append_instance((idx, instance_id, user_count))
+        
+        # 各インスタンスの詳細情報を並行して取得（オプション）
+        # 無効な場合はワールド情報のみを使用し、インスタンスごとのリクエストを行わない
+        collect_details = self.collect_details
+        columns = data['instances']
+        append_instance_id = columns['instance_id'].append
+        append_user_count = columns['user_count'].append
+        
+        if collect_details:
+            fetch_detail = self._fetch_instance_detail
+            tasks = [fetch_detail(inst[1]) for inst in instances]
+            details = await asyncio.gather(*tasks)
             
-            data['instances'].append(instance_data)
+            # 詳細情報を取得できなかったインスタンスの値はNone
+            n_users = columns['n_users'] = []
+            capacities = columns['capacity'] = []
+            types = columns['type'] = []
+            fulls = columns['full'] = []
+            platforms = columns['platforms'] = []
+            append_n_users = n_users.append
+            append_capacity = capacities.append
+            append_type = types.append
+            append_full = fulls.append
+            append_platforms = platforms.append
             
-            # レート制限対策
-            time.sleep(0.5)
+            for (idx, instance_id, user_count), instance_detail in zip(instances, details):
+                append_instance_id(instance_id)
+                append_user_count(user_count)
+                
+                if instance_detail:
+                    get = instance_detail.get
+                    append_n_users(get('n_users', 0))
+                    append_capacity(get('capacity', 0))
+                    append_type(get('type', 'unknown'))
+                    append_full(get('full', False))
+                    append_platforms(get('platforms', {}))
+                else:
+                    warning("インスタンス #%s の詳細情報を取得できませんでした", idx + 1)
+                    append_n_users(None)
+                    append_capacity(None)
+                    append_type(None)
+                    append_full(None)
+                    append_platforms(None)
+        else:
+            for idx, instance_id, user_count in instances:
+                append_instance_id(instance_id)
+                append_user_count(user_count)
         
-        logger.info(f"データ収集完了: {len(data['instances'])}個のインスタンス情報を取得")
+        instance_count = len(columns['instance_id'])
+        logger.info("データ収集完了: %s個のインスタンス情報を取得", instance_count)
         
         # 最終検証
-        if data['total_occupants'] > 0 and len(data['instances']) == 0:
+        if data['total_occupants'] > 0 and instance_count == 0:
             logger.error("警告: ユーザーが存在するのにインスタンス情報が取得できませんでした")
             logger.error("これはAPIレスポンスの形式が予想と異なる可能性があります")
         
         return data
     
+    def check_output_file(self) -> bool:
+        """
+        既存の出力ファイルがNDJSON形式かどうかを確認する
+        
+        旧バージョンのテキスト形式のファイルにNDJSONを追記してしまわないようにする。
+        問題がある場合はその内容をログに出力する。
+        
+        Returns:
+            ファイルが存在しない、空、またはNDJSON形式の場合True
+        """
+        try:
+            with open(self.output_file, 'rb') as f:
+                for line in f:
+                    if line.strip():
+                        if isinstance(orjson.loads(line), dict):
+                            return True
+                        break
+                else:
+                    return True
+        except FileNotFoundError:
+            return True
+        except orjson.JSONDecodeError:
+            pass
+        except OSError as e:
+            logger.error("出力ファイル %s を確認できません: %s", self.output_file, e)
+            return False
+        
+        logger.error("出力ファイル %s はNDJSON形式ではありません（旧バージョンのテキスト形式の可能性があります）", self.output_file)
+        logger.error("OUTPUT_FILEを別のファイル名（例: vrchat_instances.ndjson）に変更してから再実行してください")
+        return False
+    
     def save_data(self, data: Dict):
         """
         データをファイルに保存する
         
+        1回の収集データをJSONの1行としてファイルに追記する（NDJSON形式）。
+        テキスト形式への変換は render_text.py で行う。
+        
         Args:
             data: 保存するデータ
         """
         try:
-            with open(self.output_file, 'a', encoding='utf-8') as f:
-                # ヘッダー行
-                f.write(f"\n{'='*80}\n")
-                f.write(f"収集日時: {data['timestamp']}\n")
-                f.write(f"ワールド名: {data['world_name']}\n")
-                f.write(f"ワールドID: {data['world_id']}\n")
-                f.write(f"総ユーザー数: {data['total_occupants']}\n")
-                f.write(f"パブリックユーザー数: {data['public_occupants']}\n")
-                f.write(f"プライベートユーザー数: {data['private_occupants']}\n")
-                f.write(f"アクティブインスタンス数: {data['active_instances']}\n")
-                f.write(f"{'-'*80}\n")
-                
-                # インスタンス詳細
-                if data['instances']:
-                    for i, instance in enumerate(data['instances'], 1):
-                        f.write(f"\nインスタンス #{i}\n")
-                        f.write(f"  ID: {instance['instance_id']}\n")
-                        f.write(f"  ユーザー数: {instance['user_count']}\n")
-                        
-                        if 'type' in instance:
-                            f.write(f"  タイプ: {instance['type']}\n")
-                        if 'capacity' in instance:
-                            f.write(f"  最大収容人数: {instance['capacity']}\n")
-                        if 'full' in instance:
-                            f.write(f"  満員: {'はい' if instance['full'] else 'いいえ'}\n")
-                        if 'platforms' in instance and instance['platforms']:
-                            f.write(f"  プラットフォーム別: {instance['platforms']}\n")
-                else:
-                    f.write(f"\n※ アクティブなインスタンスが見つかりませんでした\n")
-                
-                f.write(f"\n{'='*80}\n")
+            if self._out_fd is None:
+                self._out_fd = os.open(self.output_file, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            
+            payload = memoryview(orjson.dumps(data) + b'\n')
+            while payload:
+                written = os.write(self._out_fd, payload)
+                payload = payload[written:]
             
-            logger.info(f"データを {self.output_file} に保存しました")
+            logger.info("データを %s に保存しました", self.output_file)
         
         except Exception as e:
-            logger.error(f"データ保存エラー: {e}", exc_info=True)
+            logger.error("データ保存エラー: %s", e, exc_info=True)
+    
+    def close(self):
+        """出力ファイルを閉じる"""
+        if self._out_fd is not None:
+            os.close(self._out_fd)
+            self._out_fd = None
+    
+    async def _wait_pending_save(self):
+        """実行中のファイル書き込みの完了を待つ"""
+        if self._pending_save is not None:
+            await self._pending_save
+            self._pending_save = None
+    
+    async def _tick(self):
+        """データを1回収集して保存する"""
+        data = await self.collect_data()
+        
+        if data:
+            # データ保存
+            # 書き込みはワーカースレッドで行い、完了は次回の保存時に確認する
+            # （前回の書き込みを待ってから次を開始するため、記録の順序は保たれる）
+            await self._wait_pending_save()
+            self._pending_save = asyncio.create_task(asyncio.to_thread(self.save_data, data))
+        else:
+            logger.warning("データ収集に失敗しました")
+    
+    async def _run_async(self, interval_minutes: int):
+        """
+        監視ループ本体
+        
+        Args:
+            interval_minutes: データ収集間隔（分）
+        """
+        keepalive_task = None
+        try:
+            # 初回認証
+            if not await self.api.authenticate():
+                logger.error("認証に失敗しました。VRCHAT_USERNAMEとVRCHAT_PASSWORDを確認してください")
+                return
+            
+            keepalive_task = asyncio.create_task(self.api.keepalive())
+            
+            while True:
+                await self._tick()
+                
+                # 次回実行まで待機（イベントループはブロックしない）
+                logger.info("%s分後に次回収集を実行します...", interval_minutes)
+                await asyncio.sleep(interval_minutes * 60)
+        finally:
+            if keepalive_task is not None:
+                # 送信中のリクエストがクライアントのクローズと競合しないよう、終了を待つ
+                keepalive_task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await keepalive_task
+            await self._wait_pending_save()
+            await self.api.close()
+            self.close()
     
     def run(self, interval_minutes: int = 10):
         """
@@ -437,43 +725,29 @@ class InstanceMonitor:
         Args:
             interval_minutes: データ収集間隔（分）
         """
-        logger.info(f"インスタンス監視を開始します（間隔: {interval_minutes}分）")
-        logger.info(f"対象ワールド: {self.world_id}")
-        logger.info(f"出力ファイル: {self.output_file}")
+        logger.info("インスタンス監視を開始します（間隔: %s分）", interval_minutes)
+        logger.info("対象ワールド: %s", self.world_id)
+        logger.info("出力ファイル: %s", self.output_file)
         logger.info("Ctrl+Cで停止できます")
         
-        # 初回認証
-        if not self.api.authenticate():
-            logger.error("認証に失敗しました。VRCHAT_USERNAMEとVRCHAT_PASSWORDを確認してください")
+        if not self.check_output_file():
             return
         
         try:
-            while True:
-                # データ収集
-                data = self.collect_data()
-                
-                if data:
-                    # データ保存
-                    self.save_data(data)
-                else:
-                    logger.warning("データ収集に失敗しました")
-                
-                # 次回実行まで待機
-                logger.info(f"{interval_minutes}分後に次回収集を実行します...")
-                time.sleep(interval_minutes * 60)
-        
+            asyncio.run(self._run_async(interval_minutes))
         except KeyboardInterrupt:
             logger.info("\n監視を停止しました")
         except Exception as e:
-            logger.error(f"予期しないエラー: {e}", exc_info=True)
+            logger.error("予期しないエラー: %s", e, exc_info=True)
 
 
 def main():
     """メイン関数"""
     # 環境変数から設定を取得
     world_id = os.getenv('VRCHAT_WORLD_ID', 'wrld_7bb60bf6-3c69-4039-a5d6-0cbbda092290')
-    output_file = os.getenv('OUTPUT_FILE', 'vrchat_instances.txt')
+    output_file = os.getenv('OUTPUT_FILE', 'vrchat_instances.ndjson')
     interval_minutes = int(os.getenv('INTERVAL_MINUTES', '10'))
+    collect_details = os.getenv('COLLECT_DETAILS', 'false').lower() == 'true'
     
     # デバッグモードの確認
     debug_mode = os.getenv('DEBUG', 'false').lower() == 'true'
@@ -481,10 +755,10 @@ def main():
         logger.setLevel(logging.DEBUG)
         logger.info("デバッグモードが有効です")
     
-    logger.info(f"設定: world_id={world_id}, output_file={output_file}, interval={interval_minutes}分")
+    logger.info("設定: world_id=%s, output_file=%s, interval=%s分, collect_details=%s", world_id, output_file, interval_minutes, collect_details)
     
     # 監視開始
-    monitor = InstanceMonitor(world_id, output_file)
+    monitor = InstanceMonitor(world_id, output_file, collect_details)
     monitor.run(interval_minutes)
 
 